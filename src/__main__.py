@@ -5,9 +5,11 @@ from multiprocessing import Pool
 import datasets
 from tqdm import tqdm
 
+from src import metrics, store
 from src.abstract import *
 from src.dblp import get_json
 from src.papers import *
+from src.resolve import AbstractResolver
 from src.s2 import *
 
 
@@ -17,7 +19,10 @@ def get_ids(conf, data, process=8):
             ids = []
             titles = [paper["info"]["title"] for paper in data]
             with Pool(process) as pool, tqdm(total=len(titles)) as pbar:
-                for result in pool.imap_unordered(s2_title_search, titles):
+                for result, m in pool.imap_unordered(
+                    metrics.collected(s2_title_search), titles
+                ):
+                    metrics.merge(m)
                     pbar.update()
                     pbar.refresh()
                     if result is not None:
@@ -26,7 +31,10 @@ def get_ids(conf, data, process=8):
             ids = []
             titles = get_ccs_papers()
             with Pool(process) as pool, tqdm(total=len(titles)) as pbar:
-                for result in pool.imap_unordered(s2_title_search, titles):
+                for result, m in pool.imap_unordered(
+                    metrics.collected(s2_title_search), titles
+                ):
+                    metrics.merge(m)
                     pbar.update()
                     pbar.refresh()
                     if result is not None:
@@ -39,9 +47,10 @@ def get_ids(conf, data, process=8):
 def get_abstracts(conf, data, process=8):
     with Pool(process) as pool, tqdm(total=len(data)) as pbar:
         results = []
-        for result in pool.imap_unordered(
-            process_paper, [(conf, paper) for paper in data]
+        for result, m in pool.imap_unordered(
+            metrics.collected(process_paper), [(conf, paper) for paper in data]
         ):
+            metrics.merge(m)
             pbar.update()
             pbar.refresh()
             if result is not None:
@@ -75,28 +84,55 @@ def main():
     parser.add_argument("--year", type=int, default=2024)
     parser.add_argument("--process", type=int)
     parser.add_argument("--path", type=str, help="Path to the datasets")
+    parser.add_argument(
+        "--resolve",
+        action="store_true",
+        help="Resolve abstracts through the cached, cost-ordered source chain",
+    )
+    parser.add_argument(
+        "--sources",
+        nargs="+",
+        choices=["cache", "s2", "publisher", "pdf"],
+        help="Override the source order of --resolve for this venue",
+    )
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="Add the papers to a parquet store at --path partitioned by conf/year",
+    )
+    metrics.add_arguments(parser)
     args = parser.parse_args()
 
     path = pathlib.Path(args.path)
 
-    data = get_json(args.conf, args.year)
+    with metrics.session(args):
+        data = get_json(args.conf, args.year)
 
-    data = [paper for paper in data if paper["info"]["type"] != "Editorship"]
+        data = [paper for paper in data if paper["info"]["type"] != "Editorship"]
 
-    results = process_papers(args.conf, data, args.process)
+        if args.resolve:
+            resolver = AbstractResolver(
+                args.conf, order=args.sources, process=args.process
+            )
+            results = resolver.resolve(data)
+        else:
+            results = process_papers(args.conf, data, args.process)
 
     def gen():
         for result in results:
             if result is not None:
-                yield {
+                row = {
                     "title": result["title"],
                     "abstract": result["abstract"],
                     "year": args.year,
                     "conf": args.conf,
                 }
+                if "source" in result:
+                    row["source"] = result["source"]
+                yield row
 
     ds = datasets.Dataset.from_generator(gen)
-    ds.save_to_disk(path)
+    store.save(ds, path, partitioned=args.partitioned)
 
 
 if __name__ == "__main__":
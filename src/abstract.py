@@ -3,9 +3,10 @@ import re
 from abc import ABC, abstractmethod
 from urllib.parse import urlparse, urlunparse
 
-import requests
 from bs4 import BeautifulSoup
 
+from src import metrics
+
 
 def get_id(url):
     parsed_url = urlparse(url)
@@ -26,7 +27,7 @@ class SemanticScholarAbstract(BasePaperAbstract):
     def get_abstract(self, url, authors):
         doi = get_id(url)
         sem_url = f"https://api.semanticscholar.org/v1/paper/{doi}"
-        response = requests.get(sem_url)
+        response = metrics.request("GET", sem_url, stage="abstract.s2")
         if response.status_code == 200:
             data = response.json()
             abstract = data.get("abstract", "No abstract available")
@@ -38,48 +39,54 @@ class SemanticScholarAbstract(BasePaperAbstract):
 class AbstractNDSS(BasePaperAbstract):
     def get_abstract(self, url, authors):
         logger.debug(f"URL: {url}")
-        r = requests.get(url)
+        r = metrics.request("GET", url, stage="abstract.ndss")
         assert r.status_code == 200
 
-        html = BeautifulSoup(r.text, "html.parser")
-        paper_data = html.find("div", {"class": "paper-data"})
-        if paper_data is not None:
-            # abstract_paragraphs = filter(lambda x: x.text != '', paper_data.find_all('p')[1:])
-            paper_data.find_next("p").replace_with("")
-            return paper_data.text.rstrip().lstrip()
-        else:
-            abstract_paragraphs = html.find(string=re.compile("Abstract:")).find_next(
-                recursive=False
-            )
-            return abstract_paragraphs.get_text(separator="\n")
+        with metrics.timed("parse.ndss"):
+            html = BeautifulSoup(r.text, "html.parser")
+            paper_data = html.find("div", {"class": "paper-data"})
+            if paper_data is not None:
+                # abstract_paragraphs = filter(lambda x: x.text != '', paper_data.find_all('p')[1:])
+                paper_data.find_next("p").replace_with("")
+                return paper_data.text.rstrip().lstrip()
+            else:
+                abstract_paragraphs = html.find(
+                    string=re.compile("Abstract:")
+                ).find_next(recursive=False)
+                return abstract_paragraphs.get_text(separator="\n")
 
 
 class AbstractUSENIX(BasePaperAbstract):
     def get_abstract(self, url, authors):
-        r = requests.get(url)
+        r = metrics.request("GET", url, stage="abstract.uss")
         logger.debug(f"URL: {url}")
         assert r.status_code == 200
 
-        html = BeautifulSoup(r.text, "html.parser")
+        with metrics.timed("parse.uss"):
+            html = BeautifulSoup(r.text, "html.parser")
 
-        abstract_paragraphs = html.find(string=re.compile("Abstract:")).find_next(
-            recursive=False
-        )
-        return abstract_paragraphs.get_text(separator="\n")
+            abstract_paragraphs = html.find(string=re.compile("Abstract:")).find_next(
+                recursive=False
+            )
+            return abstract_paragraphs.get_text(separator="\n")
 
 
 class AbstractCCS(BasePaperAbstract):
     def get_abstract(self, url, authors):
         # TODO: ACM library doesn't like me to crawl and will ban me when upset.
         logger.debug(f"URL: {url}")
-        r = requests.get(url)
+        # Never retry here: hammering ACM after a 403/429 gets us banned for longer.
+        r = metrics.request("GET", url, stage="abstract.ccs", retries=0)
         assert r.status_code == 200
 
-        html = BeautifulSoup(r.text, "html.parser")
-        paragraphs = html.find("section", {"id": "abstract"}).find_all(
-            "div", role="paragraph"
-        )
-        return "\n".join(paragraph.get_text(strip=True) for paragraph in paragraphs)
+        with metrics.timed("parse.ccs"):
+            html = BeautifulSoup(r.text, "html.parser")
+            paragraphs = html.find("section", {"id": "abstract"}).find_all(
+                "div", role="paragraph"
+            )
+            return "\n".join(
+                paragraph.get_text(strip=True) for paragraph in paragraphs
+            )
 
 
 NDSS = AbstractNDSS()
@@ -102,8 +109,8 @@ def process_paper(args):
         abstract = get_abstract(conf, url)
         return {"title": paper["info"]["title"], "abstract": abstract}
     except Exception as e:
-        logger.error(f"Failed to process: {paper['info']['title']}, url: {url}")
-        print(e)
+        metrics.inc("paper_failures_total", conf=conf, error=type(e).__name__)
+        logger.error(f"Failed to process: {paper['info']['title']}, url: {url}: {e}")
         return None
 
 
@@ -16,3 +16,49 @@ class AisuiteConfig:
 
 class InstructorConfig:
     model_name: str = "gpt-4o-mini"
+
+
+class MetricsConfig:
+    buckets: tuple = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    # opt-in retries on retry_statuses for every fetcher, off by default
+    retries: int = 0
+    backoff: float = 1.0
+    retry_statuses: tuple = (429, 500, 502, 503, 504)
+
+
+class ResolverConfig:
+    cache_path: str = "data/abstracts_cache.jsonl"
+    # abstract sources tried per venue, cheapest first
+    order: dict = {
+        "ndss": ["cache", "s2", "publisher", "pdf"],
+        "uss": ["cache", "s2", "publisher", "pdf"],
+        "sp": ["cache", "s2", "pdf"],
+        # ACM bans crawlers, so only scrape it for whatever is left
+        "ccs": ["cache", "s2", "pdf", "publisher"],
+    }
+
+
+class SummarizeConfig:
+    token_budget: int = 6000
+    chars_per_token: int = 4
+    cache_dir: str = "data/summary_cache"
+    max_workers: int = 8
+
+
+class CascadeConfig:
+    enabled: bool = False
+    # "lexical" scores papers locally, anything else names the cheap model
+    cheap_model: str = "gpt-4.1-nano"
+    # cheap accepts are always confirmed by InstructorConfig.model_name; cheap
+    # rejects scoring at most `low` (and below every relevant paper seen during
+    # the warm-up) skip it, everything else is escalated
+    low: float = 0.2
+    # escalated verdicts used to calibrate the reject threshold before any
+    # cheap reject is trusted
+    warmup: int = 50
+    # fraction of cheap rejects re-checked by the strong model
+    audit_rate: float = 0.05
+    # stop rejecting cheaply once this share of at least min_audits audits
+    # disagrees with the strong model
+    max_disagreement: float = 0.05
+    min_audits: int = 20
@@ -1,6 +1,7 @@
 # %%
 import json
-import requests
+
+from src import metrics
 
 TEMPLATE = "https://dblp.org/search/publ/api?q=toc:db/conf/{conf}/{conf}{year}.bht:&h=1000&format={format}"
 CONFERENCE = {
@@ -13,7 +14,7 @@ CONFERENCE = {
 
 def get_json(conf, year):
     url = TEMPLATE.format(conf=conf, year=year, format="json")
-    res = requests.get(url)
+    res = metrics.request("GET", url, stage="dblp")
     if res.ok:
         try:
             data = json.loads(res.text)['result']['hits']['hit']
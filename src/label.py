@@ -1,8 +1,10 @@
 import argparse
 import json
+import pickle
 
 import datasets
 
+from src import metrics, store
 from src.utils import call_llm
 
 
@@ -34,15 +36,35 @@ def classify_paper(paper):
     return json.loads(response)
 
 
+def classify_paper_with_metrics(paper):
+    # map() runs in worker processes, so ship their metrics back as a column
+    result, snapshot = metrics.collected(classify_paper)(paper)
+    return {**result, "_metrics": pickle.dumps(snapshot)}
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset", help="Path to the dataset")
     parser.add_argument("--output", help="Path to the output")
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="Write the output as parquet partitioned by conf/year",
+    )
+    store.add_where_argument(parser)
+    metrics.add_arguments(parser)
     args = parser.parse_args()
 
-    ds = datasets.load_from_disk(args.dataset)
-    new_ds = ds.map(classify_paper, num_proc=10)
-    new_ds.save_to_disk(args.output)
+    ds = store.load(args.dataset, where=args.where)
+    with metrics.session(args):
+        if args.metrics:
+            new_ds = ds.map(classify_paper_with_metrics, num_proc=10)
+            for snapshot in new_ds["_metrics"]:
+                metrics.merge(pickle.loads(snapshot))
+            new_ds = new_ds.remove_columns("_metrics")
+        else:
+            new_ds = ds.map(classify_paper, num_proc=10)
+    store.save(new_ds, args.output, partitioned=args.partitioned)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,265 @@
+import cProfile
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from src.config import MetricsConfig
+
+_lock = threading.Lock()
+# pid of the process that imported this module first; forked workers inherit it
+_MAIN_PID = os.getpid()
+_counters: Dict[tuple, float] = defaultdict(float)
+_histograms: Dict[tuple, Dict[str, Any]] = {}
+
+
+def _key(name: str, labels: Dict[str, Any]) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Increment the counter `name` with the given labels."""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record `value` into the histogram `name` with the given labels."""
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        if hist is None:
+            hist = {"buckets": [0] * len(MetricsConfig.buckets), "sum": 0.0, "count": 0}
+            _histograms[_key(name, labels)] = hist
+        for i, bound in enumerate(MetricsConfig.buckets):
+            if value <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+
+
+@contextmanager
+def timed(stage: str, **labels) -> Iterator[None]:
+    """Time the enclosed block as `stage_seconds{stage=...}`, counting errors."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        inc("stage_errors_total", stage=stage, error=type(e).__name__, **labels)
+        raise
+    finally:
+        observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+
+def cache(name: str, hit: bool) -> None:
+    """Record a cache lookup for the cache called `name`."""
+    inc("cache_lookups_total", cache=name, result="hit" if hit else "miss")
+
+
+def llm_usage(stage: str, model: str, response: Any) -> None:
+    """Record token usage from an OpenAI-style completion response, if present."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            inc("llm_tokens_total", tokens, stage=stage, model=model, kind=kind)
+
+
+def request(method: str, url: str, stage: str, retries: Optional[int] = None, **kwargs):
+    """Issue an HTTP request, recording per-host latency, status codes and retries.
+
+    Responses with a status in `MetricsConfig.retry_statuses` are retried up to
+    `retries` times (default `MetricsConfig.retries`, 0 so instrumentation does
+    not change how hosts are hit) with exponential backoff; the last response is
+    returned.
+    """
+    host = urlparse(url).netloc
+    if retries is None:
+        retries = MetricsConfig.retries
+    for attempt in range(retries + 1):
+        if attempt:
+            inc("http_retries_total", stage=stage, host=host)
+            time.sleep(MetricsConfig.backoff * 2 ** (attempt - 1))
+        with timed(stage, host=host):
+            response = requests.request(method, url, **kwargs)
+        inc("http_responses_total", stage=stage, host=host, status=response.status_code)
+        if response.status_code not in MetricsConfig.retry_statuses:
+            break
+    return response
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return a picklable copy of all recorded metrics."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {
+                k: {**v, "buckets": list(v["buckets"])} for k, v in _histograms.items()
+            },
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def merge(other: Dict[str, Any]) -> None:
+    """Merge a snapshot (e.g. from a worker process) into the local metrics."""
+    with _lock:
+        for k, v in other["counters"].items():
+            _counters[k] += v
+        for k, v in other["histograms"].items():
+            hist = _histograms.setdefault(
+                k, {"buckets": [0] * len(MetricsConfig.buckets), "sum": 0.0, "count": 0}
+            )
+            hist["buckets"] = [a + b for a, b in zip(hist["buckets"], v["buckets"])]
+            hist["sum"] += v["sum"]
+            hist["count"] += v["count"]
+
+
+def _in_worker() -> bool:
+    """Whether this is a pool worker, of `multiprocessing` or of `multiprocess`
+    (the fork `datasets.map(num_proc=...)` uses)"""
+    if os.getpid() != _MAIN_PID or multiprocessing.parent_process() is not None:
+        return True
+    try:
+        import multiprocess
+    except ImportError:
+        return False
+    return multiprocess.parent_process() is not None
+
+
+class collected:
+    """Wrap a Pool task so it returns `(result, metrics)` recorded in the worker.
+
+    Usage: `for result, m in pool.imap_unordered(collected(fn), args): merge(m)`
+
+    When the task runs in the main process (e.g. `datasets` falling back to one
+    process) its metrics are already recorded in place, so an empty snapshot is
+    returned and the main process' metrics are left untouched.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, *args):
+        if not _in_worker():
+            return self.fn(*args), {"counters": {}, "histograms": {}}
+        reset()
+        try:
+            return self.fn(*args), snapshot()
+        finally:
+            reset()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple, **extra) -> str:
+    items = [*labels, *((k, str(v)) for k, v in extra.items())]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def to_prometheus() -> str:
+    """Render the metrics in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = []
+    for (name, labels), value in sorted(data["counters"].items()):
+        if f"# TYPE papers_{name} counter" not in lines:
+            lines.append(f"# TYPE papers_{name} counter")
+        lines.append(f"papers_{name}{_labels(labels)} {value:g}")
+    for (name, labels), hist in sorted(data["histograms"].items()):
+        if f"# TYPE papers_{name} histogram" not in lines:
+            lines.append(f"# TYPE papers_{name} histogram")
+        for bound, count in zip(MetricsConfig.buckets, hist["buckets"]):
+            lines.append(f"papers_{name}_bucket{_labels(labels, le=bound)} {count}")
+        lines.append(f'papers_{name}_bucket{_labels(labels, le="+Inf")} {hist["count"]}')
+        lines.append(f"papers_{name}_sum{_labels(labels)} {hist['sum']:g}")
+        lines.append(f"papers_{name}_count{_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def to_json() -> Dict[str, Any]:
+    """Summarize the metrics as JSON, with cache hit rates precomputed."""
+    data = snapshot()
+    counters = [
+        {"name": name, "labels": dict(labels), "value": value}
+        for (name, labels), value in sorted(data["counters"].items())
+    ]
+    histograms = [
+        {
+            "name": name,
+            "labels": dict(labels),
+            "count": hist["count"],
+            "sum": hist["sum"],
+            "mean": hist["sum"] / hist["count"] if hist["count"] else 0.0,
+            "buckets": dict(zip(map(str, MetricsConfig.buckets), hist["buckets"])),
+        }
+        for (name, labels), hist in sorted(data["histograms"].items())
+    ]
+    lookups = defaultdict(lambda: {"hit": 0, "miss": 0})
+    for (name, labels), value in data["counters"].items():
+        if name == "cache_lookups_total":
+            labels = dict(labels)
+            lookups[labels["cache"]][labels["result"]] += value
+    cache_hit_rate = {
+        name: c["hit"] / (c["hit"] + c["miss"]) for name, c in lookups.items()
+    }
+    return {
+        "counters": counters,
+        "histograms": histograms,
+        "cache_hit_rate": cache_hit_rate,
+    }
+
+
+def dump(path: str | Path) -> None:
+    """Write the metrics to `path`: JSON for `.json`, Prometheus text otherwise."""
+    path = Path(path)
+    if path.suffix == ".json":
+        path.write_text(json.dumps(to_json(), indent=2))
+    else:
+        path.write_text(to_prometheus())
+
+
+def add_arguments(parser) -> None:
+    """Add the `--metrics` and `--profile` options to an argparse parser."""
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="Write run metrics to this file (.json for JSON, Prometheus text otherwise)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="Write a cProfile dump of the run to this file (view with snakeviz/pstats)",
+    )
+
+
+@contextmanager
+def session(args) -> Iterator[None]:
+    """Profile the enclosed run and dump metrics according to `add_arguments` options."""
+    profiler = cProfile.Profile() if getattr(args, "profile", None) else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if getattr(args, "metrics", None):
+            dump(args.metrics)
@@ -4,10 +4,11 @@ import os
 from pathlib import Path
 from typing import Any, Iterator, Optional
 
-import datasets
 from notion_client import Client
 from rich.console import Console
 
+from src import metrics, store
+
 console = Console()
 
 
@@ -55,6 +56,7 @@ class NotionClient:
         year: int | None = None,
         conf: str | None = None,
         paper_type: str | None = None,
+        summary: str | None = None,
     ) -> Optional[dict[str, Any]]:
         """Add a single page to the Notion database.
 
@@ -64,6 +66,7 @@ class NotionClient:
             year: Publication year
             conf: Conference name
             type: Type of the paper
+            summary: Paper summary (will be truncated to 2000 chars if longer)
 
         Returns:
             Response from Notion API if successful, None otherwise
@@ -84,29 +87,41 @@ class NotionClient:
         if paper_type:
             properties["Type"] = {"select": {"name": paper_type}}
 
+        if summary:
+            properties["Summary"] = {
+                "rich_text": [{"text": {"content": self._truncate_text(summary, 2000)}}]
+            }
+
         page_data = {
             "parent": {"database_id": self.database_id},
             "properties": properties,
         }
 
         try:
-            response = self.client.pages.create(**page_data)
+            with metrics.timed("notion.add_page"):
+                response = self.client.pages.create(**page_data)
+            metrics.inc("notion_pages_total", result="ok")
             console.print(f"✅ Added paper: {title}", style="green")
             return response
         except Exception as e:
+            metrics.inc("notion_pages_total", result=type(e).__name__)
             console.print(f"❌ Error adding paper '{title}': {str(e)}", style="red")
             return None
 
-    def _load_dataset(self, path: str | Path) -> Iterator[dict[str, Any]]:
-        """Load data from a Hugging Face dataset.
+    def _load_dataset(
+        self, path: str | Path, where: list[str] | None = None
+    ) -> Iterator[dict[str, Any]]:
+        """Load data from a Hugging Face dataset or partitioned parquet store.
 
         Args:
             path: Path to the dataset directory
+            where: Filters restricting the papers loaded
 
         Yields:
             Dictionary containing paper information
         """
-        ds = datasets.load_from_disk(path)
+        columns = ["title", "abstract", "year", "conf", "type", "summary"]
+        ds = store.load(path, where=where, columns=columns)
         yield from ds
 
     def _load_jsonl(self, path: str | Path) -> Iterator[dict[str, Any]]:
@@ -122,11 +137,14 @@ class NotionClient:
             for line in f:
                 yield json.loads(line)
 
-    def import_data(self, file_path: str | Path) -> None:
+    def import_data(
+        self, file_path: str | Path, where: list[str] | None = None
+    ) -> None:
         """Import papers from either a dataset or JSONL file into Notion.
 
         Args:
             file_path: Path to the data file or directory
+            where: Filters restricting the papers imported (datasets only)
         """
         path = Path(file_path)
 
@@ -134,8 +152,10 @@ class NotionClient:
             # Determine the data source type and load accordingly
             if path.is_dir():
                 console.print("📂 Loading from dataset directory...", style="blue")
-                data_iterator = self._load_dataset(path)
+                data_iterator = self._load_dataset(path, where)
             elif path.suffix == ".jsonl":
+                if where:
+                    raise ValueError("--where is only supported for datasets")
                 console.print("📄 Loading from JSONL file...", style="blue")
                 data_iterator = self._load_jsonl(path)
             else:
@@ -157,6 +177,7 @@ class NotionClient:
                     year=item.get("year"),
                     conf=item.get("conf"),
                     paper_type=item.get("type"),
+                    summary=item.get("summary"),
                 )
 
         except Exception as e:
@@ -175,11 +196,14 @@ def main():
         required=True,
         help="Path to the dataset directory or JSONL file",
     )
+    store.add_where_argument(parser)
+    metrics.add_arguments(parser)
 
     args = parser.parse_args()
 
     notion = NotionClient(database_id=args.database_id)
-    notion.import_data(args.input_path)
+    with metrics.session(args):
+        notion.import_data(args.input_path, where=args.where)
 
 
 if __name__ == "__main__":
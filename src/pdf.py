@@ -17,6 +17,18 @@ def parse_pdf(file):
     abstract = '\n'.join(abstract_content)
     return abstract
 
+
+def pdf_chunks(file):
+    """Return the text of every chunk in the pdf, prefixed with its headings"""
+    conv_res = converter.convert(file)
+    chunks = []
+    for chunk in chunker.chunk(conv_res.document):
+        if chunk.meta.headings:
+            chunks.append(' > '.join(chunk.meta.headings) + '\n' + chunk.text)
+        else:
+            chunks.append(chunk.text)
+    return chunks
+
 # %%
 
 
@@ -0,0 +1,275 @@
+import json
+import logging
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from tqdm import tqdm
+
+from src import metrics
+from src.abstract import get_abstract
+from src.config import ResolverConfig
+from src.s2 import s2_batch, s2_title_search
+
+logger = logging.getLogger("AbstractResolver")
+
+
+def paper_key(info: Dict[str, Any]) -> str:
+    """Key a DBLP paper by its DOI, falling back to its normalized title"""
+    if info.get("doi"):
+        return "doi:" + info["doi"].lower()
+    return "title:" + re.sub(r"[^a-z0-9]+", " ", info["title"].lower()).strip()
+
+
+def _paper_url(info: Dict[str, Any]) -> Optional[str]:
+    ee = info.get("ee")
+    return ee[0] if isinstance(ee, list) else ee
+
+
+class BaseAbstractSource(ABC):
+    name: str
+
+    @abstractmethod
+    def resolve(
+        self, conf: str, papers: Dict[str, Dict[str, Any]], hints: Dict[str, Dict]
+    ) -> Dict[str, str]:
+        """Resolve abstracts for some of `papers` (key -> DBLP info).
+
+        `hints` holds per-key extras found by earlier sources (e.g. PDF urls),
+        which sources may read and add to. Returns key -> abstract.
+        """
+
+
+class CacheSource(BaseAbstractSource):
+    name = "cache"
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries[entry["key"]] = entry
+
+    def resolve(self, conf, papers, hints):
+        found = {}
+        for key in papers:
+            entry = self.entries.get(key)
+            metrics.cache("abstracts", entry is not None)
+            if entry is not None:
+                found[key] = entry["abstract"]
+        return found
+
+    def add(self, key: str, title: str, abstract: str, source: str) -> None:
+        entry = {"key": key, "title": title, "abstract": abstract, "source": source}
+        self.entries[key] = entry
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+class S2BatchSource(BaseAbstractSource):
+    """Look up papers in one S2 batch call
+
+    Papers with a DOI are looked up by it. DBLP has no DOI for some venues
+    (e.g. USENIX Security), so those are first matched to S2 paper ids by
+    title, one search request per paper in a process pool.
+    """
+
+    name = "s2"
+
+    def __init__(self, process: int = 8):
+        self.process = process
+
+    def _title_ids(self, papers: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        keys = [key for key, info in papers.items() if not info.get("doi")]
+        ids = {}
+        if not keys:
+            return ids
+        titles = [papers[key]["title"] for key in keys]
+        with Pool(self.process) as pool, tqdm(
+            total=len(titles), desc="s2 title search"
+        ) as pbar:
+            results = pool.imap(metrics.collected(s2_title_search), titles)
+            for key, (result, m) in zip(keys, results):
+                metrics.merge(m)
+                pbar.update()
+                if result is not None:
+                    ids[key] = result["paperId"]
+        return ids
+
+    def resolve(self, conf, papers, hints):
+        ids = {
+            key: f"DOI:{info['doi']}" for key, info in papers.items() if info.get("doi")
+        }
+        ids.update(self._title_ids(papers))
+        keys = list(ids)
+        results = s2_batch(
+            [ids[key] for key in keys],
+            fields="title,abstract,openAccessPdf",
+        )
+        found = {}
+        for key, result in zip(keys, results):
+            if result is None:
+                continue
+            if result.get("abstract"):
+                found[key] = result["abstract"]
+            pdf = result.get("openAccessPdf") or {}
+            if pdf.get("url"):
+                hints.setdefault(key, {})["pdf_url"] = pdf["url"]
+        return found
+
+
+def _publisher_abstract(args):
+    conf, url = args
+    try:
+        return get_abstract(conf, url)
+    except Exception as e:
+        logger.error(f"Failed to scrape {url}: {e}")
+        return None
+
+
+def _pdf_abstract(url):
+    try:
+        response = metrics.request("GET", url, stage="resolve.pdf_download")
+        if response.status_code != 200:
+            return None
+        # docling is heavy, only import it in workers that actually parse PDFs
+        from src.pdf import parse_pdf
+
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+            f.write(response.content)
+            f.flush()
+            with metrics.timed("resolve.pdf_parse"):
+                return parse_pdf(f.name) or None
+    except Exception as e:
+        logger.error(f"Failed to extract abstract from {url}: {e}")
+        return None
+
+
+class _PoolSource(BaseAbstractSource):
+    """Resolve papers one by one in a process pool"""
+
+    def __init__(self, process: int = 8):
+        self.process = process
+
+    @abstractmethod
+    def tasks(self, conf, papers, hints) -> Dict[str, Any]:
+        """Return key -> argument for `fn`, for the papers this source can try"""
+
+    def resolve(self, conf, papers, hints):
+        tasks = self.tasks(conf, papers, hints)
+        found = {}
+        if not tasks:
+            return found
+        with Pool(self.process) as pool, tqdm(
+            total=len(tasks), desc=self.name
+        ) as pbar:
+            results = pool.imap(metrics.collected(self.fn), tasks.values())
+            for key, (abstract, m) in zip(tasks, results):
+                metrics.merge(m)
+                pbar.update()
+                if abstract:
+                    found[key] = abstract
+        return found
+
+
+class PublisherSource(_PoolSource):
+    name = "publisher"
+    fn = staticmethod(_publisher_abstract)
+
+    def tasks(self, conf, papers, hints):
+        return {
+            key: (conf, _paper_url(info))
+            for key, info in papers.items()
+            if _paper_url(info)
+        }
+
+
+class PdfSource(_PoolSource):
+    name = "pdf"
+    fn = staticmethod(_pdf_abstract)
+
+    def tasks(self, conf, papers, hints):
+        tasks = {}
+        for key, info in papers.items():
+            url = hints.get(key, {}).get("pdf_url")
+            if url is None and (_paper_url(info) or "").endswith(".pdf"):
+                url = _paper_url(info)
+            if url:
+                tasks[key] = url
+        return tasks
+
+
+class AbstractResolver:
+    """Resolve abstracts by trying sources per venue in order of cost.
+
+    Every source only sees the papers left unresolved by the sources before it,
+    so one S2 batch call covers most papers and the slow or ban-prone scrapers
+    only run for the leftovers. A source that fails outright passes all of its
+    papers on to the next one.
+    """
+
+    def __init__(
+        self,
+        conf: str,
+        order: Optional[List[str]] = None,
+        cache_path: Optional[str] = None,
+        process: int = 8,
+    ):
+        self.conf = conf
+        self.order = order or ResolverConfig.order[conf]
+        self.cache = CacheSource(cache_path or ResolverConfig.cache_path)
+        sources = {
+            "cache": self.cache,
+            "s2": S2BatchSource(process),
+            "publisher": PublisherSource(process),
+            "pdf": PdfSource(process),
+        }
+        self.sources = [sources[name] for name in self.order]
+
+    def resolve(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Resolve abstracts for DBLP hits, recording where each one came from
+
+        Returns:
+            One `{"title", "abstract", "source"}` dict per resolved paper, with
+            `source` like "s2", "publisher" or "cache:pdf" for cache hits
+        """
+        pending = {paper_key(paper["info"]): paper["info"] for paper in data}
+        hints = {}
+        results = []
+        for source in self.sources:
+            if not pending:
+                break
+            try:
+                with metrics.timed("resolve." + source.name):
+                    found = source.resolve(self.conf, pending, hints)
+            except Exception as e:
+                # hand every pending paper on to the next source
+                metrics.inc("resolve_source_failures_total", source=source.name)
+                logger.error(
+                    f"{source.name}: failed for {len(pending)} papers, trying the next source: {e}"
+                )
+                continue
+            logger.info(
+                f"{source.name}: resolved {len(found)} of {len(pending)} papers"
+            )
+            metrics.inc("resolved_total", len(found), conf=self.conf, source=source.name)
+            for key, abstract in found.items():
+                info = pending.pop(key)
+                if source is self.cache:
+                    provenance = "cache:" + self.cache.entries[key]["source"]
+                else:
+                    provenance = source.name
+                    self.cache.add(key, info["title"], abstract, source.name)
+                results.append(
+                    {"title": info["title"], "abstract": abstract, "source": provenance}
+                )
+        metrics.inc("resolved_total", len(pending), conf=self.conf, source="none")
+        for info in pending.values():
+            logger.error(f"No source resolved: {info['title']}")
+        return results
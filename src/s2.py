@@ -1,9 +1,9 @@
-import requests
+from src import metrics
 
 
 def s2_title_search(title):
     url = f"https://api.semanticscholar.org/graph/v1/paper/search/match?query={title}"
-    response = requests.get(url)
+    response = metrics.request("GET", url, stage="s2.search")
     if response.status_code == 200:
         id = response.json()["data"][0]
         print(id)
@@ -11,8 +11,26 @@ def s2_title_search(title):
     return None
 
 
-def s2_abstracts(ids):
+def s2_abstracts(ids, fields="abstract,title"):
     url = "https://api.semanticscholar.org/graph/v1/paper/batch"
-    params = {"fields": "abstract,title"}
-    response = requests.post(url, params=params, json={"ids": ids})
+    params = {"fields": fields}
+    response = metrics.request(
+        "POST", url, stage="s2.batch", params=params, json={"ids": ids}
+    )
     return response.json()
+
+
+def s2_batch(ids, fields="abstract,title", batch_size=500):
+    """Look up any number of ids, `batch_size` (the API maximum) per request.
+
+    Returns one entry per id, `None` where S2 does not know the paper.
+    """
+    results = []
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start : start + batch_size]
+        data = s2_abstracts(chunk, fields)
+        if not isinstance(data, list):
+            # error payloads come back as a dict, e.g. {"message": "..."}
+            data = [None] * len(chunk)
+        results.extend(data)
+    return results
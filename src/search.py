@@ -1,49 +1,132 @@
 import argparse
+import itertools
 import json
-from typing import Any, Dict, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import random
+import re
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-import datasets
 import instructor
 from openai import OpenAI
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from tqdm import tqdm
 
+from src import metrics, store
 from src.utils import call_llm
-from src.config import InstructorConfig, OpenaiConfig
+from src.config import CascadeConfig, InstructorConfig, OpenaiConfig
 
 
 class RelevanceCheck(BaseModel):
     relevant: bool
 
 
+class QueryVerdict(BaseModel):
+    query_id: int
+    relevant: bool
+    score: float = Field(ge=0, le=1, description="Relevance score from 0 to 1")
+
+
+class MultiRelevanceCheck(BaseModel):
+    verdicts: List[QueryVerdict]
+
+
+def load_queries(path: str | Path) -> List[str]:
+    """Read one query per line, skipping blank lines and `#` comments"""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+_STOPWORDS = {
+    "a", "about", "an", "and", "are", "as", "at", "by", "for", "from", "in",
+    "into", "is", "of", "on", "or", "papers", "paper", "research", "that",
+    "the", "their", "to", "using", "with", "work", "works",
+}
+
+
+def _terms(text: str) -> set:
+    return {
+        word[:6]
+        for word in re.findall(r"[a-z0-9]+", text.lower())
+        if len(word) > 2 and word not in _STOPWORDS
+    }
+
+
+def _query_filename(idx: int, query: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", query.lower()).strip("_")[:50]
+    return f"{idx:03d}_{slug}.jsonl"
+
+
 class PaperSemanticSearch:
-    def __init__(self, dataset_path: str, max_workers: int = 5):
+    def __init__(
+        self,
+        dataset_path: str,
+        max_workers: int = 5,
+        where: Optional[List[str]] = None,
+        cascade: bool = CascadeConfig.enabled,
+    ):
         """
         Initialize the semantic search engine
 
         Args:
             dataset_path: Path to the datasets file
             max_workers: Maximum number of concurrent threads
+            where: Filters restricting the papers searched, see `store.parse_where`
+            cascade: Score papers with the cheap scorer of `CascadeConfig` first
+                and only escalate ambiguous ones to `InstructorConfig.model_name`
         """
-        self.dataset = datasets.load_from_disk(dataset_path)
+        self.dataset = store.load(
+            dataset_path, where=where, columns=["title", "abstract", "year", "conf"]
+        )
         self.max_workers = max_workers
+        self.cascade = cascade
+        self._cascade_lock = threading.Lock()
+        self.cascade_stats = {
+            "verdicts": 0,
+            "escalated": 0,
+            "escalated_agree": 0,
+            "audited": 0,
+            "audited_agree": 0,
+        }
+        # audits of cheap rejects: [count, disagreements]
+        self._audits = [0, 0]
+        self._rejects_enabled = True
+        # warm-up calibration: escalated verdicts seen, and the lowest cheap
+        # score of a paper the strong model found relevant
+        self._warmup_seen = 0
+        self._min_positive_score = None
 
     def _get_paper_content(self, paper: Dict[str, Any]) -> str:
         """Get formatted paper content for comparison"""
         return f"""Title: {paper['title']}
                 Abstract: {paper.get('abstract', 'N/A')}"""
 
-    def _extract_relevance_check(self, prompt: str) -> RelevanceCheck:
-        client = instructor.from_openai(
+    def _get_paper_record(self, paper: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the fields of a paper written to the search results"""
+        return {
+            "title": paper.get("title", "N/A"),
+            "abstract": paper.get("abstract", "N/A"),
+            "year": paper.get("year", "N/A"),
+            "conf": paper.get("conf", "N/A"),
+        }
+
+    def _client(self):
+        return instructor.from_openai(
             OpenAI(base_url=OpenaiConfig.base_url, api_key=OpenaiConfig.api_key)
         )
 
-        response = client.chat.completions.create(
-            model=InstructorConfig.model_name,
-            response_model=RelevanceCheck,
-            messages=[{"role": "user", "content": prompt}],
-        )
+    def _extract_relevance_check(self, prompt: str) -> RelevanceCheck:
+        client = self._client()
+
+        with metrics.timed("search.extract", model=InstructorConfig.model_name):
+            response, completion = client.chat.completions.create_with_completion(
+                model=InstructorConfig.model_name,
+                response_model=RelevanceCheck,
+                messages=[{"role": "user", "content": prompt}],
+            )
+        metrics.llm_usage("search.extract", InstructorConfig.model_name, completion)
         return response
 
     def _check_relevance(self, query: str, paper_content: str) -> bool:
@@ -82,37 +165,349 @@ class PaperSemanticSearch:
             List of relevant papers
         """
         relevant_papers = []
-        papers_list = list(self.dataset)
+
+        def single_judge(queries, paper_content):
+            # escalations go through the same judge as a search without cascade
+            relevant = self._check_relevance(query, paper_content).relevant
+            return {0: QueryVerdict(query_id=0, relevant=relevant, score=float(relevant))}
 
         def process_paper(paper):
             paper_content = self._get_paper_content(paper)
             try:
-                if self._check_relevance(query, paper_content).relevant:
-                    return {
-                        "title": paper.get("title", "N/A"),
-                        "abstract": paper.get("abstract", "N/A"),
-                        "year": paper.get("year", "N/A"),
-                        "conf": paper.get("conf", "N/A"),
-                    }
+                with metrics.timed("search.paper"):
+                    if self.cascade:
+                        verdict = self._judge(
+                            {0: query}, paper_content, strong_judge=single_judge
+                        ).get(0)
+                        relevant = verdict is not None and verdict.relevant
+                    else:
+                        relevant = self._check_relevance(query, paper_content).relevant
+                metrics.inc("search_verdicts_total", relevant=relevant)
+                if relevant:
+                    return self._get_paper_record(paper)
             except Exception as e:
+                metrics.inc("search_failures_total", error=type(e).__name__)
                 print(
                     f"Error processing paper {paper.get('title', 'Unknown')}: {str(e)}"
                 )
             return None
 
+        with tqdm(total=len(self.dataset), desc="Searching papers") as pbar:
+            for result in self._map_papers(process_paper):
+                if result:
+                    relevant_papers.append(result)
+                pbar.update(1)
+
+        return relevant_papers
+
+    def _map_papers(self, fn) -> Iterator[Any]:
+        """
+        Apply fn to every paper on the thread pool, yielding results as they complete
+
+        Rows are read from the dataset lazily and at most `4 * max_workers` are in
+        flight at once, so the dataset is never materialized in memory. Pending
+        calls are cancelled when the caller stops iterating early.
+        """
+        papers = iter(self.dataset)
+        limit = 4 * self.max_workers
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_paper = {
-                executor.submit(process_paper, paper): paper for paper in papers_list
-            }
-
-            with tqdm(total=len(papers_list), desc="Searching papers") as pbar:
-                for future in as_completed(future_to_paper):
-                    result = future.result()
-                    if result:
-                        relevant_papers.append(result)
+            pending = set()
+            try:
+                while True:
+                    for paper in itertools.islice(papers, limit - len(pending)):
+                        pending.add(executor.submit(fn, paper))
+                    if not pending:
+                        return
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _check_relevance_many(
+        self,
+        queries: Dict[int, str],
+        paper_content: str,
+        model: Optional[str] = None,
+    ) -> Dict[int, QueryVerdict]:
+        """
+        Judge a paper against several queries in a single structured request
+
+        Query ids the model leaves out of its answer are asked for once more on
+        their own; ids still missing after that are logged and counted.
+
+        Args:
+            queries: Mapping from query id to query text
+            paper_content: Paper's content (title + abstract)
+            model: Model used for the judgement, `InstructorConfig.model_name` by default
+
+        Returns:
+            Mapping from query id to its verdict; queries the model skipped twice
+            are missing from the result
+        """
+        model = model or InstructorConfig.model_name
+        verdicts = self._request_relevance_many(queries, paper_content, model)
+        missing = {idx: q for idx, q in queries.items() if idx not in verdicts}
+        if missing:
+            metrics.inc("search_verdict_retries_total", len(missing), model=model)
+            verdicts.update(
+                self._request_relevance_many(missing, paper_content, model)
+            )
+            missing = [idx for idx in missing if idx not in verdicts]
+        if missing:
+            metrics.inc("search_missing_verdicts_total", len(missing), model=model)
+            print(f"No verdict from {model} for queries {missing}")
+        return verdicts
+
+    def _request_relevance_many(
+        self, queries: Dict[int, str], paper_content: str, model: str
+    ) -> Dict[int, QueryVerdict]:
+        query_list = "\n".join(f"[{idx}] {query}" for idx, query in queries.items())
+        prompt = f"""Please analyze if the following academic paper is relevant to each of these queries/topics:
+                    {query_list}
+                    Paper:
+                    {paper_content}
+                    For every query, return its id, whether the paper is relevant, and a relevance score between 0 and 1."""
+
+        client = self._client()
+        with metrics.timed("search.multi", model=model):
+            response, completion = client.chat.completions.create_with_completion(
+                model=model,
+                response_model=MultiRelevanceCheck,
+                messages=[{"role": "user", "content": prompt}],
+            )
+        metrics.llm_usage("search.multi", model, completion)
+        return {v.query_id: v for v in response.verdicts if v.query_id in queries}
+
+    def _score_lexical(
+        self, queries: Dict[int, str], paper_content: str
+    ) -> Dict[int, QueryVerdict]:
+        """Score queries by the fraction of their terms found in the paper"""
+        paper_terms = _terms(paper_content)
+        verdicts = {}
+        for idx, query in queries.items():
+            terms = _terms(query)
+            score = len(terms & paper_terms) / len(terms) if terms else 0.0
+            verdicts[idx] = QueryVerdict(query_id=idx, relevant=score >= 0.5, score=score)
+        return verdicts
+
+    def _cheap_rejects(self, verdict: Optional[QueryVerdict]) -> bool:
+        """
+        Whether the cheap verdict alone may reject the paper for a query
+
+        Cheap accepts are never trusted, they are always confirmed by the strong
+        model. Rejects are trusted only after the warm-up, when the cheap model
+        says not relevant and scores below both `CascadeConfig.low` and every
+        score it gave to a paper the strong model found relevant during the
+        warm-up, and only while audits of rejects keep agreeing with the strong
+        model (see `_record_audit`).
+        """
+        if verdict is None or verdict.relevant or not self._rejects_enabled:
+            return False
+        if self._warmup_seen < CascadeConfig.warmup:
+            return False
+        return verdict.score <= CascadeConfig.low and (
+            self._min_positive_score is None or verdict.score < self._min_positive_score
+        )
+
+    def _record_warmup(self, cheap: QueryVerdict, strong: QueryVerdict) -> None:
+        """Calibrate the reject threshold from a strong verdict on an escalated query"""
+        if self._warmup_seen < CascadeConfig.warmup:
+            self._warmup_seen += 1
+        if strong.relevant and (
+            self._min_positive_score is None or cheap.score < self._min_positive_score
+        ):
+            self._min_positive_score = cheap.score
+
+    def _record_audit(self, agree: bool) -> None:
+        """Stop rejecting cheaply once audits of cheap rejects disagree too often"""
+        self._audits[0] += 1
+        self._audits[1] += not agree
+        if (
+            self._rejects_enabled
+            and self._audits[0] >= CascadeConfig.min_audits
+            and self._audits[1] / self._audits[0] > CascadeConfig.max_disagreement
+        ):
+            self._rejects_enabled = False
+            print("Cascade: cheap rejects disagree too often, escalating them")
+
+    def _judge(
+        self,
+        queries: Dict[int, str],
+        paper_content: str,
+        strong_judge: Optional[
+            Callable[[Dict[int, str], str], Dict[int, QueryVerdict]]
+        ] = None,
+    ) -> Dict[int, QueryVerdict]:
+        """
+        Judge a paper against queries, through the model cascade if enabled
+
+        Only cheap rejects trusted by `_cheap_rejects` skip the strong judge.
+        Everything else, plus an `audit_rate` sample of the cheap rejects, goes
+        to the strong judge in one request, whose verdicts are final.
+
+        Args:
+            queries: Mapping from query id to query text
+            paper_content: Paper's content (title + abstract)
+            strong_judge: Judge used without the cascade, `_check_relevance_many`
+                by default, so both modes give the same final verdicts
+
+        Returns:
+            Mapping from query id to its verdict
+        """
+        strong_judge = strong_judge or self._check_relevance_many
+        if not self.cascade:
+            return strong_judge(queries, paper_content)
+
+        with metrics.timed("search.cascade.cheap"):
+            if CascadeConfig.cheap_model == "lexical":
+                cheap = self._score_lexical(queries, paper_content)
+            else:
+                cheap = self._check_relevance_many(
+                    queries, paper_content, model=CascadeConfig.cheap_model
+                )
+
+        with self._cascade_lock:
+            rejects = {idx for idx in queries if self._cheap_rejects(cheap.get(idx))}
+        escalated, audited, verdicts = {}, {}, {}
+        for idx, query in queries.items():
+            if idx not in rejects:
+                escalated[idx] = query
+                continue
+            if random.random() < CascadeConfig.audit_rate:
+                audited[idx] = query
+            verdicts[idx] = QueryVerdict(
+                query_id=idx, relevant=False, score=cheap[idx].score
+            )
+
+        strong = {}
+        if escalated or audited:
+            with metrics.timed("search.cascade.strong"):
+                strong = strong_judge({**escalated, **audited}, paper_content)
+            verdicts.update(strong)
+
+        with self._cascade_lock:
+            stats = self.cascade_stats
+            stats["verdicts"] += len(queries)
+            for kind, subset in (("escalated", escalated), ("audited", audited)):
+                stats[kind] += len(subset)
+                metrics.inc("cascade_verdicts_total", len(subset), route=kind)
+                for idx in subset:
+                    if idx in strong and idx in cheap:
+                        agree = strong[idx].relevant == cheap[idx].relevant
+                        stats[f"{kind}_agree"] += agree
+                        metrics.inc("cascade_agreement_total", route=kind, agree=agree)
+                        if kind == "audited":
+                            self._record_audit(agree)
+                        else:
+                            self._record_warmup(cheap[idx], strong[idx])
+            cheap_only = len(queries) - len(escalated) - len(audited)
+            metrics.inc("cascade_verdicts_total", cheap_only, route="cheap")
+        return verdicts
+
+    def cascade_report(self) -> str:
+        """Summarize the escalation rate and cheap/strong agreement of the cascade"""
+        stats = self.cascade_stats
+        total = stats["verdicts"] or 1
+        lines = [
+            f"Cascade ({CascadeConfig.cheap_model} -> {InstructorConfig.model_name}):",
+            f"  escalated {stats['escalated']}/{stats['verdicts']} "
+            f"({stats['escalated'] / total:.1%})",
+        ]
+        for kind in ("escalated", "audited"):
+            if stats[kind]:
+                lines.append(
+                    f"  {kind} agreement {stats[kind + '_agree']}/{stats[kind]} "
+                    f"({stats[kind + '_agree'] / stats[kind]:.1%})"
+                )
+        return "\n".join(lines)
+
+    def search_many(
+        self,
+        queries: List[str],
+        output_dir: str | Path,
+        top_k: Optional[int] = None,
+        queries_per_request: int = 10,
+    ) -> Dict[int, int]:
+        """
+        Search for papers relevant to each of several queries in one pass
+
+        Every paper is serialized once and judged against all queries, batching
+        `queries_per_request` queries into each LLM request. Relevant papers are
+        streamed to one JSONL file per query in `output_dir` as soon as they are
+        judged.
+
+        Args:
+            queries: Search queries or descriptions of the topics
+            output_dir: Directory receiving one JSONL file per query
+            top_k: Stop once every query has this many relevant papers
+            queries_per_request: Maximum number of queries judged per request
+
+        Returns:
+            Number of relevant papers found per query index
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with open(output_dir / "queries.json", "w") as f:
+            json.dump(
+                [
+                    {"query": query, "file": _query_filename(idx, query)}
+                    for idx, query in enumerate(queries)
+                ],
+                f,
+                indent=2,
+            )
+
+        indexed = list(enumerate(queries))
+        groups = [
+            dict(indexed[start : start + queries_per_request])
+            for start in range(0, len(indexed), queries_per_request)
+        ]
+        found = {idx: 0 for idx in range(len(queries))}
+
+        def process_paper(paper):
+            paper_content = self._get_paper_content(paper)
+            verdicts = {}
+            for group in groups:
+                if top_k is not None and all(found[idx] >= top_k for idx in group):
+                    continue
+                try:
+                    verdicts.update(self._judge(group, paper_content))
+                except Exception as e:
+                    metrics.inc("search_failures_total", error=type(e).__name__)
+                    print(
+                        f"Error processing paper {paper.get('title', 'Unknown')}: {str(e)}"
+                    )
+            return paper, verdicts
+
+        files = [
+            open(output_dir / _query_filename(idx, query), "w")
+            for idx, query in enumerate(queries)
+        ]
+        try:
+            with tqdm(total=len(self.dataset), desc="Searching papers") as pbar:
+                for paper, verdicts in self._map_papers(process_paper):
                     pbar.update(1)
+                    for idx, verdict in verdicts.items():
+                        metrics.inc("search_verdicts_total", relevant=verdict.relevant)
+                        if not verdict.relevant:
+                            continue
+                        if top_k is not None and found[idx] >= top_k:
+                            continue
+                        record = self._get_paper_record(paper)
+                        record["query"] = queries[idx]
+                        record["score"] = verdict.score
+                        files[idx].write(json.dumps(record) + "\n")
+                        files[idx].flush()
+                        found[idx] += 1
+                    if top_k is not None and all(n >= top_k for n in found.values()):
+                        break
+        finally:
+            for f in files:
+                f.close()
 
-        return relevant_papers
+        return found
 
 
 def main():
@@ -122,11 +517,29 @@ def main():
     parser.add_argument(
         "--dataset", type=str, required=True, help="Path to the dataset file"
     )
+    query_group = parser.add_mutually_exclusive_group(required=True)
+    query_group.add_argument("--query", type=str, help="Search query or description")
+    query_group.add_argument(
+        "--queries",
+        type=str,
+        help="File with one query per line, evaluated together in one pass",
+    )
     parser.add_argument(
-        "--query", type=str, required=True, help="Search query or description"
+        "--output",
+        type=str,
+        required=True,
+        help="Path to the output file (a directory with one JSONL per query for --queries)",
     )
     parser.add_argument(
-        "--output", type=str, required=True, help="Path to the output file"
+        "--top-k",
+        type=int,
+        help="With --queries, stop once every query has this many relevant papers",
+    )
+    parser.add_argument(
+        "--queries-per-request",
+        type=int,
+        default=10,
+        help="With --queries, maximum number of queries judged in one LLM request",
     )
     parser.add_argument(
         "--max-workers",
@@ -134,15 +547,45 @@ def main():
         default=5,
         help="Maximum number of concurrent threads",
     )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        default=CascadeConfig.enabled,
+        help="Score papers with the cheap scorer first, escalating only ambiguous ones",
+    )
+    store.add_where_argument(parser)
+    metrics.add_arguments(parser)
 
     args = parser.parse_args()
 
     searcher = PaperSemanticSearch(
-        dataset_path=args.dataset, max_workers=args.max_workers
+        dataset_path=args.dataset,
+        max_workers=args.max_workers,
+        where=args.where,
+        cascade=args.cascade,
     )
 
+    if args.queries:
+        queries = load_queries(args.queries)
+        with metrics.session(args):
+            found = searcher.search_many(
+                queries,
+                args.output,
+                top_k=args.top_k,
+                queries_per_request=args.queries_per_request,
+            )
+        print(f"\nSearched {len(queries)} queries, results in {args.output}:")
+        for idx, query in enumerate(queries):
+            print(f"{found[idx]:5d}  {query}")
+        if args.cascade:
+            print(searcher.cascade_report())
+        return
+
     query = args.query
-    results = searcher.search(query)
+    with metrics.session(args):
+        results = searcher.search(query)
+    if args.cascade:
+        print(searcher.cascade_report())
 
     print(f"\nFound {len(results)} relevant papers:")
     for i, paper in enumerate(results, 1):
@@ -0,0 +1,146 @@
+import argparse
+import re
+from pathlib import Path
+from typing import List, Optional
+
+import datasets
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
+
+from src import metrics
+
+PARTITIONS = ["conf", "year"]
+
+_COMPARISON = re.compile(r"^\s*(\w+)\s*(!=|>=|<=|==|=|>|<)\s*(.*?)\s*$")
+_MEMBERSHIP = re.compile(r"^\s*(\w+)\s+in\s+(.*?)\s*$")
+
+
+def _value(text: str):
+    text = text.strip().strip("'\"")
+    return int(text) if re.fullmatch(r"-?\d+", text) else text
+
+
+def parse_where(filters: Optional[List[str]]) -> Optional[pc.Expression]:
+    """Parse `--where` filters into one Arrow expression, AND-ing them together
+
+    Supported forms: `col=value`, `col!=value`, `col>=value` (also `>`, `<=`,
+    `<`) and `col in a,b,c`, e.g. `year>=2023` or `type=Large Model Security`.
+    """
+    expr = None
+    for text in filters or []:
+        if match := _MEMBERSHIP.match(text):
+            col, values = match.groups()
+            cond = pc.field(col).isin([_value(v) for v in values.split(",")])
+        elif match := _COMPARISON.match(text):
+            col, op, value = match.groups()
+            field, value = pc.field(col), _value(value)
+            cond = {
+                "=": field == value,
+                "==": field == value,
+                "!=": field != value,
+                ">=": field >= value,
+                "<=": field <= value,
+                ">": field > value,
+                "<": field < value,
+            }[op]
+        else:
+            raise ValueError(f"Unsupported --where filter: {text!r}")
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def _mask(batch, expr: pc.Expression):
+    """Evaluate expr on an Arrow batch as a boolean mask, nulls counting as false"""
+    mask = pads.dataset(batch).to_table(columns={"mask": expr})["mask"]
+    return pc.fill_null(mask, False)
+
+
+def is_partitioned(path: str | Path) -> bool:
+    """Whether path is a partitioned parquet store rather than a `save_to_disk` dataset"""
+    return not (Path(path) / "state.json").exists()
+
+
+def load(
+    path: str | Path,
+    where: Optional[List[str]] = None,
+    columns: Optional[List[str]] = None,
+) -> datasets.Dataset:
+    """Load a dataset, reading only the rows matching `where` and the given columns
+
+    For a partitioned parquet store, partitions excluded by the conf/year filters
+    are never opened and parquet column statistics skip row groups of the rest.
+    `save_to_disk` datasets stay memory-mapped: they are filtered through Arrow
+    into an on-disk indices mapping, and returned as is without filters.
+    Requested columns missing from the data are ignored.
+    """
+    expr = parse_where(where)
+    with metrics.timed("store.load"):
+        if is_partitioned(path):
+            source = pads.dataset(path, format="parquet", partitioning="hive")
+            names = source.schema.names
+            if columns is not None:
+                columns = [c for c in columns if c in names]
+            ds = datasets.Dataset(source.to_table(columns=columns, filter=expr))
+        else:
+            ds = datasets.load_from_disk(str(path))
+            if expr is not None:
+                ds = (
+                    ds.with_format("arrow")
+                    .filter(lambda batch: _mask(batch, expr), batched=True)
+                    .with_format(None)
+                )
+            if columns is not None:
+                ds = ds.select_columns([c for c in columns if c in ds.column_names])
+    metrics.inc("store_rows_loaded_total", ds.num_rows)
+    return ds
+
+
+def save_partitioned(ds: datasets.Dataset, path: str | Path) -> None:
+    """Write a dataset as parquet partitioned by conf/year
+
+    Only the conf/year partitions present in `ds` are replaced, so several
+    crawls can be written into the same store.
+    """
+    # the arrow format applies any pending select/filter indices
+    table = ds.with_format("arrow")[:]
+    pads.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=PARTITIONS,
+        partitioning_flavor="hive",
+        existing_data_behavior="delete_matching",
+    )
+
+
+def save(ds: datasets.Dataset, path: str | Path, partitioned: bool = False) -> None:
+    if partitioned:
+        save_partitioned(ds, path)
+    else:
+        ds.save_to_disk(path)
+
+
+def add_where_argument(parser) -> None:
+    parser.add_argument(
+        "--where",
+        action="append",
+        help="Only load papers matching this filter, e.g. 'conf in ndss,sp' or "
+        "'year>=2023' (repeatable, AND-ed)",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a dataset to parquet partitioned by conf/year"
+    )
+    parser.add_argument("--dataset", required=True, help="Path to the dataset")
+    parser.add_argument("--output", required=True, help="Path to the output store")
+    add_where_argument(parser)
+    args = parser.parse_args()
+
+    ds = load(args.dataset, where=args.where)
+    save_partitioned(ds, args.output)
+
+
+if __name__ == "__main__":
+    main()
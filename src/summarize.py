@@ -0,0 +1,238 @@
+import argparse
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import datasets
+from tqdm import tqdm
+
+from src import metrics, store
+from src.config import AisuiteConfig, SummarizeConfig
+from src.utils import call_llm
+
+CHUNK_PROMPT = """The user will provide consecutive sections of an academic paper. Summarize them in a few sentences, keeping the problem, the proposed technique, key results and any limitations that are mentioned. Only use information from the provided text."""
+
+PAPER_PROMPT = """The user will provide the text of an academic paper. Summarize it in a single paragraph covering the problem, the proposed approach, the evaluation results and the limitations. Only use information from the provided text."""
+
+REDUCE_PROMPT = """The user will provide partial summaries of consecutive parts of one academic paper. Merge them into a single summary of one paragraph covering the problem, the proposed approach, the evaluation results and the limitations. Do not repeat information."""
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of tokens in text"""
+    return len(text) // SummarizeConfig.chars_per_token + 1
+
+
+def pack_chunks(chunks: List[str], budget: int) -> List[str]:
+    """Greedily pack consecutive chunks into texts of at most `budget` tokens
+
+    Chunks larger than the budget on their own are split by characters.
+    """
+    max_chars = budget * SummarizeConfig.chars_per_token
+    pieces = []
+    for chunk in chunks:
+        pieces.extend(chunk[i : i + max_chars] for i in range(0, len(chunk), max_chars))
+
+    packs = []
+    current, used = [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and used + tokens > budget:
+            packs.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += tokens
+    if current:
+        packs.append("\n\n".join(current))
+    return packs
+
+
+class SummaryCache:
+    """Summaries on disk, keyed by the hash of model, prompt and input text"""
+
+    def __init__(self, cache_dir: str | Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, prompt: str, text: str) -> Path:
+        digest = hashlib.sha256(
+            "\0".join([AisuiteConfig.model_name, prompt, text]).encode()
+        ).hexdigest()
+        return self.cache_dir / f"{digest}.json"
+
+    def get(self, prompt: str, text: str) -> Optional[str]:
+        path = self._path(prompt, text)
+        hit = path.exists()
+        metrics.cache("summaries", hit)
+        if hit:
+            return json.loads(path.read_text())["summary"]
+        return None
+
+    def put(self, prompt: str, text: str, summary: str) -> None:
+        path = self._path(prompt, text)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"summary": summary}))
+        tmp.replace(path)
+
+
+class PaperSummarizer:
+    def __init__(
+        self,
+        token_budget: int = SummarizeConfig.token_budget,
+        cache_dir: str = SummarizeConfig.cache_dir,
+        max_workers: int = SummarizeConfig.max_workers,
+    ):
+        """
+        Map-reduce summarizer for full paper texts
+
+        Args:
+            token_budget: Maximum number of input tokens per LLM request
+            cache_dir: Directory of the summary cache
+            max_workers: Maximum number of concurrent LLM requests
+        """
+        self.token_budget = token_budget
+        self.cache = SummaryCache(cache_dir)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _summarize(self, prompt: str, text: str) -> str:
+        summary = self.cache.get(prompt, text)
+        if summary is None:
+            messages = [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": text},
+            ]
+            with metrics.timed("summarize.llm"):
+                summary = call_llm(messages=messages)
+            self.cache.put(prompt, text, summary)
+        return summary
+
+    def summarize(self, chunks: List[str]) -> str:
+        """
+        Summarize a paper from its text chunks
+
+        Chunks are packed up to the token budget and summarized concurrently,
+        then the partial summaries are packed and merged level by level until
+        one summary is left.
+
+        Args:
+            chunks: Text chunks of the paper in document order
+
+        Returns:
+            The summary of the paper, empty if there is no text
+        """
+        packs = pack_chunks(chunks, self.token_budget)
+        if not packs:
+            return ""
+        if len(packs) == 1:
+            return self._summarize(PAPER_PROMPT, packs[0])
+
+        summaries = list(
+            self.executor.map(lambda pack: self._summarize(CHUNK_PROMPT, pack), packs)
+        )
+        while len(summaries) > 1:
+            packs = pack_chunks(summaries, self.token_budget)
+            if len(packs) == len(summaries):
+                # every summary fills a pack, merge pairs to keep making progress
+                packs = [
+                    "\n\n".join(summaries[i : i + 2])
+                    for i in range(0, len(summaries), 2)
+                ]
+            summaries = list(
+                self.executor.map(
+                    lambda pack: self._summarize(REDUCE_PROMPT, pack), packs
+                )
+            )
+        return summaries[0]
+
+
+def _normalize_title(title: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "", title.lower())
+
+
+def find_pdfs(
+    ds: datasets.Dataset, pdf_dir: Optional[str]
+) -> List[Optional[Path]]:
+    """Locate the pdf of every paper
+
+    Uses the `pdf` column when the dataset has one, otherwise matches the file
+    names in `pdf_dir` against the paper titles.
+    """
+    if "pdf" in ds.column_names:
+        return [Path(pdf) if pdf else None for pdf in ds["pdf"]]
+    files: Dict[str, Path] = {}
+    if pdf_dir:
+        files = {_normalize_title(p.stem): p for p in Path(pdf_dir).rglob("*.pdf")}
+    return [files.get(_normalize_title(title)) for title in ds["title"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize full papers and add a summary column to the dataset"
+    )
+    parser.add_argument("--dataset", required=True, help="Path to the dataset")
+    parser.add_argument(
+        "--pdf-dir", help="Directory of pdfs named after the paper titles"
+    )
+    parser.add_argument("--output", required=True, help="Path to the output")
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=SummarizeConfig.token_budget,
+        help="Maximum number of input tokens per LLM request",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=SummarizeConfig.max_workers,
+        help="Maximum number of concurrent LLM requests",
+    )
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="Write the output as parquet partitioned by conf/year",
+    )
+    store.add_where_argument(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    # docling is heavy, only load it when actually summarizing
+    from src.pdf import pdf_chunks
+
+    ds = store.load(args.dataset, where=args.where)
+    summarizer = PaperSummarizer(
+        token_budget=args.token_budget, max_workers=args.max_workers
+    )
+    summaries = []
+    with metrics.session(args):
+        for paper, pdf in tqdm(
+            zip(ds, find_pdfs(ds, args.pdf_dir)), total=len(ds), desc="Summarizing"
+        ):
+            if pdf is None:
+                metrics.inc("summaries_total", result="no_pdf")
+                summaries.append("")
+                continue
+            try:
+                with metrics.timed("summarize.parse"):
+                    chunks = [chunk for chunk in pdf_chunks(pdf) if chunk.strip()]
+                if not chunks:
+                    # scanned or image-only pdfs yield no text
+                    metrics.inc("summaries_total", result="no_text")
+                    summaries.append("")
+                    continue
+                summaries.append(summarizer.summarize(chunks))
+                metrics.inc("summaries_total", result="ok")
+            except Exception as e:
+                metrics.inc("summaries_total", result=type(e).__name__)
+                print(f"Error summarizing paper {paper['title']}: {str(e)}")
+                summaries.append("")
+
+    if "summary" in ds.column_names:
+        ds = ds.remove_columns("summary")
+    ds = ds.add_column("summary", summaries)
+    store.save(ds, args.output, partitioned=args.partitioned)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ from typing import Any, Dict, List
 
 import aisuite as ai
 
+from src import metrics
 from src.config import ModelConfig, OpenaiConfig, AisuiteConfig
 
 
@@ -20,10 +21,12 @@ def call_llm(
     params = {k: getattr(ModelConfig, k) for k in ModelConfig.__annotations__}
     params.update(kwargs)
 
-    response = client.chat.completions.create(
-        model=AisuiteConfig.model_name,
-        messages=messages,
-        **params,
-    )
+    with metrics.timed("llm", model=AisuiteConfig.model_name):
+        response = client.chat.completions.create(
+            model=AisuiteConfig.model_name,
+            messages=messages,
+            **params,
+        )
+    metrics.llm_usage("llm", AisuiteConfig.model_name, response)
 
     return response.choices[0].message.content